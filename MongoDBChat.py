@@ -1,54 +1,142 @@
+import asyncio
+import base64
+import copy
+import hashlib
 import json
-import re
+import os
 import sys
-from typing import Dict, List, Any
-from openai import OpenAI
+import tempfile
+import time
+from functools import lru_cache
+from collections import OrderedDict
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Dict, List, AsyncIterator
+import ahocorasick
+from openai import AsyncOpenAI
+from prompt_toolkit import PromptSession
+from prompt_toolkit.completion import WordCompleter
+from prompt_toolkit.history import FileHistory
 import pymongo
-from bson import ObjectId
+from pymongo import WriteConcern
+from bson import Decimal128, ObjectId, json_util
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".mongodbchat")
+CACHE_TTL_SECONDS = 3600
+HISTORY_PATH = os.path.join(CACHE_DIR, "history")
+NLP_CACHE_SIZE = 1024
+CURSOR_BATCH_SIZE = 1000
+# Query operators that find() accepts but an aggregation $match stage rejects
+MATCH_UNSUPPORTED_OPERATORS = ("$where", "$near", "$nearSphere")
+# Projection operators that find() accepts but an aggregation $project rejects
+FIND_ONLY_PROJECTION_OPERATORS = ("$slice", "$elemMatch")
+
+PROMPT_SUFFIX = """
+IMPORTANT: Make sure to select the correct database and collection names from the available options listed above.
+
+Output ONLY a valid JSON object with the following structure with NO explanations or additional text:
+{
+"database": "[exact database name from the list above]",
+"collection": "[exact collection name from the list above]",
+"operation": "[find/aggregate/insert_one/update_one/delete_one/etc]",
+"parameters": {
+    "filter": {
+        // filter conditions go here
+    },
+    // other operation-specific parameters
+}
+}
+
+For find operations, ALWAYS put filter conditions inside a "filter" object within parameters.
+For insert_many operations that bulk-load data without needing confirmation, set "fast": true in parameters.
+"""
+SCHEMA_SAMPLE_SIZE = 20
+SCHEMA_TYPE_STAGES = [
+    {"$project": {"fields": {"$objectToArray": "$$ROOT"}}},
+    {"$unwind": "$fields"},
+    {"$group": {"_id": "$fields.k", "type": {"$first": {"$type": "$fields.v"}}}}
+]
+
+_JSON_DECODER = json.JSONDecoder()
 
 class MongoDBConnector:
     
-    def __init__(self, connection_string: str = 'mongodb://localhost:27017/'):
+    def __init__(self, connection_string: str = 'mongodb://localhost:27017/',
+                 max_pool_size: int = 100, min_pool_size: int = 10,
+                 server_selection_timeout_ms: int = 3000, socket_timeout_ms: int = None,
+                 compressors: str = "zstd,snappy,zlib", zlib_compression_level: int = 6):
+        self.connection_string = connection_string
+        # Per-instance cache so it neither pins this connector nor is shared with others
+        self._get_collection = lru_cache(maxsize=256)(self._collection_handle)
+        try:
+            self.client = pymongo.AsyncMongoClient(
+                connection_string,
+                maxPoolSize=max_pool_size,
+                minPoolSize=min_pool_size,
+                serverSelectionTimeoutMS=server_selection_timeout_ms,
+                socketTimeoutMS=socket_timeout_ms,
+                # Negotiated with the server in order; zlib needs no extra package
+                compressors=compressors,
+                zlibCompressionLevel=zlib_compression_level
+            )
+        except Exception as e:
+            print(f"Error connecting to MongoDB: {e}")
+            raise
+    
+    async def connect(self):
         try:
-            self.client = pymongo.MongoClient(connection_string)
-            self.client.admin.command('ping')
+            await self.client.admin.command('ping')
             print("Connected to MongoDB successfully!")
         except Exception as e:
             print(f"Error connecting to MongoDB: {e}")
             raise
-        
-    def get_databases(self) -> List[str]:
-        return [db for db in self.client.list_database_names() 
-                if db not in ['admin', 'local', 'config']]
     
-    def get_collections(self, database_name: str) -> List[str]:
-        db = self.client[database_name]
-        return db.list_collection_names()
+    async def close(self):
+        await self.client.close()
     
-    def get_sample_data(self, database_name: str, collection_name: str, limit: int = 5) -> List[Dict]:
-        db = self.client[database_name]
-        collection = db[collection_name]
-        return list(collection.find().limit(limit))
+    def _collection_handle(self, database_name: str, collection_name: str):
+        return self.client[database_name][collection_name]
     
-    def get_collection_schema(self, database_name: str, collection_name: str) -> Dict[str, str]:
-        db = self.client[database_name]
-        collection = db[collection_name]
-        sample = collection.find_one()
-        
-        if not sample:
-            return {}
-        
-        schema = {}
-        for key, value in sample.items():
-            schema[key] = type(value).__name__
+    def clear_collection_cache(self):
+        self._get_collection.cache_clear()
+    
+    async def get_server_version(self) -> str:
+        server_info = await self.client.server_info()
+        return server_info["version"]
         
-        return schema
+    async def get_databases(self) -> List[str]:
+        return [db for db in await self.client.list_database_names() 
+                if db not in ['admin', 'local', 'config']]
     
-    def execute_find(self, database_name: str, collection_name: str, 
-                    query_filter: Dict = None, projection: Dict = None,
-                    sort: List = None, limit: int = None, skip: int = None) -> List[Dict]:
+    async def get_collections(self, database_name: str) -> List[str]:
         db = self.client[database_name]
-        collection = db[collection_name]
+        return await db.list_collection_names()
+    
+    async def get_sample_data(self, database_name: str, collection_name: str, limit: int = 5) -> List[Dict]:
+        collection = self._get_collection(database_name, collection_name)
+        return await collection.find().limit(limit).to_list(None)
+    
+    async def execute_find(self, database_name: str, collection_name: str, 
+                          query_filter: Dict = None, projection: Dict = None,
+                          sort: List = None, limit: int = None, skip: int = None) -> AsyncIterator[Dict]:
+        if (sort and limit and not self._has_match_unsupported_operator(query_filter)
+                and not self._has_find_only_projection(projection)):
+            # As a pipeline the optimizer coalesces $sort + $limit into a top-k
+            # sort, which is O(N log K) instead of sorting every match
+            pipeline = [{"$match": query_filter or {}}, {"$sort": self._sort_spec(sort)}]
+            if skip:
+                pipeline.append({"$skip": skip})
+            pipeline.append({"$limit": limit})
+            if projection:
+                pipeline.append({"$project": projection})
+            return await self.execute_aggregate(database_name, collection_name, pipeline)
+        
+        collection = self._get_collection(database_name, collection_name)
         
         cursor = collection.find(filter=query_filter or {}, projection=projection)
         
@@ -57,35 +145,77 @@ class MongoDBConnector:
         if skip:
             cursor = cursor.skip(skip)
         if limit:
-            cursor = cursor.limit(limit)
+            cursor = cursor.limit(limit).batch_size(min(limit, CURSOR_BATCH_SIZE))
             
-        return list(cursor)
-    
-    def execute_aggregate(self, database_name: str, collection_name: str, 
-                         pipeline: List[Dict]) -> List[Dict]:
-        db = self.client[database_name]
-        collection = db[collection_name]
-        return list(collection.aggregate(pipeline))
+        return cursor
+    
+    def _sort_spec(self, sort) -> Dict:
+        # Same forms cursor.sort() accepts: a field name, a mapping, or a list
+        # of (field, direction) pairs and/or bare field names (ascending)
+        if isinstance(sort, str):
+            return {sort: pymongo.ASCENDING}
+        if isinstance(sort, Mapping):
+            return dict(sort)
+        
+        spec = {}
+        for item in sort:
+            if isinstance(item, str):
+                spec[item] = pymongo.ASCENDING
+            else:
+                field, direction = item
+                spec[field] = direction
+        return spec
+    
+    def _has_match_unsupported_operator(self, value) -> bool:
+        if isinstance(value, dict):
+            return any(key in MATCH_UNSUPPORTED_OPERATORS or self._has_match_unsupported_operator(item)
+                       for key, item in value.items())
+        if isinstance(value, list):
+            return any(self._has_match_unsupported_operator(item) for item in value)
+        return False
+    
+    def _has_find_only_projection(self, projection) -> bool:
+        if not isinstance(projection, dict):
+            return False
+        return any(
+            key.endswith(".$")
+            or (isinstance(value, dict) and any(op in value for op in FIND_ONLY_PROJECTION_OPERATORS))
+            for key, value in projection.items()
+        )
     
-    def execute_insert_one(self, database_name: str, collection_name: str, 
-                          document: Dict) -> Dict:
-        db = self.client[database_name]
-        collection = db[collection_name]
-        result = collection.insert_one(document)
+    async def execute_aggregate(self, database_name: str, collection_name: str, 
+                               pipeline: List[Dict]) -> AsyncIterator[Dict]:
+        collection = self._get_collection(database_name, collection_name)
+        # Let heavy $group/$sort stages spill to disk instead of failing at the
+        # 100 MiB limit, and pin the batch size so results stream in large chunks
+        return await collection.aggregate(pipeline, allowDiskUse=True, batchSize=CURSOR_BATCH_SIZE)
+    
+    async def execute_insert_one(self, database_name: str, collection_name: str, 
+                                document: Dict) -> Dict:
+        collection = self._get_collection(database_name, collection_name)
+        result = await collection.insert_one(document)
         return {"acknowledged": result.acknowledged, "inserted_id": result.inserted_id}
     
-    def execute_insert_many(self, database_name: str, collection_name: str, 
-                           documents: List[Dict]) -> Dict:
-        db = self.client[database_name]
-        collection = db[collection_name]
-        result = collection.insert_many(documents)
-        return {"acknowledged": result.acknowledged, "inserted_ids": result.inserted_ids}
-    
-    def execute_update_one(self, database_name: str, collection_name: str, 
-                          filter_query: Dict, update_query: Dict, upsert: bool = False) -> Dict:
-        db = self.client[database_name]
-        collection = db[collection_name]
-        result = collection.update_one(filter_query, update_query, upsert=upsert)
+    async def execute_insert_many(self, database_name: str, collection_name: str, 
+                                 documents: List[Dict], batch_size: int = 100, fast: bool = False) -> Dict:
+        collection = self._get_collection(database_name, collection_name)
+        if fast:
+            # Fire-and-forget writes for bulk loads that don't need confirmation
+            collection = collection.with_options(write_concern=WriteConcern(w=0))
+        
+        acknowledged = True
+        inserted_ids = []
+        for i in range(0, len(documents), batch_size):
+            result = await collection.insert_many(documents[i:i + batch_size], ordered=False)
+            acknowledged = acknowledged and result.acknowledged
+            inserted_ids.extend(result.inserted_ids)
+        
+        return {"acknowledged": acknowledged, "inserted_ids": inserted_ids}
+    
+    async def execute_update_one(self, database_name: str, collection_name: str, 
+                                filter_query: Dict, update_query: Dict, upsert: bool = False) -> Dict:
+        collection = self._get_collection(database_name, collection_name)
+        result = await collection.update_one(filter_query, update_query, upsert=upsert)
         return {
             "acknowledged": result.acknowledged,
             "matched_count": result.matched_count,
@@ -93,11 +223,10 @@ class MongoDBConnector:
             "upserted_id": result.upserted_id
         }
     
-    def execute_update_many(self, database_name: str, collection_name: str, 
-                           filter_query: Dict, update_query: Dict, upsert: bool = False) -> Dict:
-        db = self.client[database_name]
-        collection = db[collection_name]
-        result = collection.update_many(filter_query, update_query, upsert=upsert)
+    async def execute_update_many(self, database_name: str, collection_name: str, 
+                                 filter_query: Dict, update_query: Dict, upsert: bool = False) -> Dict:
+        collection = self._get_collection(database_name, collection_name)
+        result = await collection.update_many(filter_query, update_query, upsert=upsert)
         return {
             "acknowledged": result.acknowledged,
             "matched_count": result.matched_count,
@@ -105,39 +234,79 @@ class MongoDBConnector:
             "upserted_id": result.upserted_id
         }
     
-    def execute_delete_one(self, database_name: str, collection_name: str, 
-                          filter_query: Dict) -> Dict:
-        db = self.client[database_name]
-        collection = db[collection_name]
-        result = collection.delete_one(filter_query)
+    async def execute_delete_one(self, database_name: str, collection_name: str, 
+                                filter_query: Dict) -> Dict:
+        collection = self._get_collection(database_name, collection_name)
+        result = await collection.delete_one(filter_query)
         return {"acknowledged": result.acknowledged, "deleted_count": result.deleted_count}
     
-    def execute_delete_many(self, database_name: str, collection_name: str, 
-                           filter_query: Dict) -> Dict:
-        db = self.client[database_name]
-        collection = db[collection_name]
-        result = collection.delete_many(filter_query)
+    async def execute_delete_many(self, database_name: str, collection_name: str, 
+                                 filter_query: Dict) -> Dict:
+        collection = self._get_collection(database_name, collection_name)
+        result = await collection.delete_many(filter_query)
         return {"acknowledged": result.acknowledged, "deleted_count": result.deleted_count}
     
-    def count_documents(self, database_name: str, collection_name: str, 
-                       filter_query: Dict = None) -> int:
-        db = self.client[database_name]
-        collection = db[collection_name]
-        return collection.count_documents(filter_query or {})
+    async def count_documents(self, database_name: str, collection_name: str, 
+                             filter_query: Dict = None) -> int:
+        collection = self._get_collection(database_name, collection_name)
+        
+        if not filter_query:
+            # Metadata-based count: O(1) instead of a collection scan, but may
+            # be slightly stale after an unclean shutdown or on sharded clusters
+            return await collection.estimated_document_count()
+        
+        return await collection.count_documents(filter_query)
 
 
 class NLPProcessor:
     
-    def __init__(self, api_key):
+    def __init__(self, api_key, cache_size: int = NLP_CACHE_SIZE):
         print("Initializing OpenAI GPT-3.5 Turbo...")
-        self.client = OpenAI(api_key=api_key)
+        self.client = AsyncOpenAI(api_key=api_key)
         print("OpenAI client initialized successfully!")
-        
-    def process_query(self, query: str, schema_info: Dict) -> Dict:
+        self.cache_size = cache_size
+        self._response_cache = OrderedDict()
+        self._hashed_schema = None
+        self._schema_hash = None
+        self._prompt_schema = None
+        self._prompt_prefix = None
+        
+    async def process_query(self, query: str, schema_info: Dict) -> Dict:
+        cache_key = self._get_cache_key(query, schema_info)
+        
+        cached = self._response_cache.get(cache_key)
+        if cached is not None:
+            self._response_cache.move_to_end(cache_key)
+            print("\nUsing cached interpretation of this query.")
+            return copy.deepcopy(cached)
+        
+        return await self._process_uncached(query, schema_info)
+    
+    def remember(self, query: str, schema_info: Dict, parsed_query: Dict):
+        # Called only after the plan executed successfully, so a plan that
+        # parses but fails is never replayed from the cache
+        cache_key = self._get_cache_key(query, schema_info)
+        self._response_cache[cache_key] = copy.deepcopy(parsed_query)
+        self._response_cache.move_to_end(cache_key)
+        if len(self._response_cache) > self.cache_size:
+            self._response_cache.popitem(last=False)
+    
+    def _get_cache_key(self, query: str, schema_info: Dict) -> tuple:
+        return (" ".join(query.split()), self._get_schema_hash(schema_info))
+    
+    def _get_schema_hash(self, schema_info: Dict) -> str:
+        # schema_info is only replaced wholesale on refresh, so rehash on a new object
+        if schema_info is not self._hashed_schema:
+            encoded = _json_dumps(schema_info, sort_keys=True).encode()
+            self._schema_hash = hashlib.blake2b(encoded, digest_size=8).hexdigest()
+            self._hashed_schema = schema_info
+        return self._schema_hash
+    
+    async def _process_uncached(self, query: str, schema_info: Dict) -> Dict:
         prompt = self._build_prompt(query, schema_info)
         
         try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "system", "content": "You are a MongoDB query assistant that converts natural language to MongoDB queries."},
@@ -162,51 +331,44 @@ class NLPProcessor:
             return {"error": f"OpenAI API error: {str(e)}"}
         
     def _build_prompt(self, query: str, schema_info: Dict) -> str:
+        # The schema part of the prompt only changes when schema_info is replaced
+        if schema_info is not self._prompt_schema:
+            self._prompt_prefix = self._build_prompt_prefix(schema_info)
+            self._prompt_schema = schema_info
+        
+        return f"{self._prompt_prefix}\nUser query: {query}\n{PROMPT_SUFFIX}"
+    
+    def _build_prompt_prefix(self, schema_info: Dict) -> str:
         db_structure = "Available databases and collections:\n"
         for db_name, db_info in schema_info["databases"].items():
             collections = list(db_info["collections"].keys())
             db_structure += f"- Database: {db_name}, Collections: {', '.join(collections)}\n"
         
-        prompt = f"""
-        You are a MongoDB query assistant. Convert the following natural language query to a structured MongoDB operation.
-        
-        {db_structure}
-        
-        User query: {query}
-        
-        IMPORTANT: Make sure to select the correct database and collection names from the available options listed above.
-        
-        Output ONLY a valid JSON object with the following structure with NO explanations or additional text:
-        {{
-        "database": "[exact database name from the list above]",
-        "collection": "[exact collection name from the list above]",
-        "operation": "[find/aggregate/insert_one/update_one/delete_one/etc]",
-        "parameters": {{
-            "filter": {{
-                // filter conditions go here
-            }},
-            // other operation-specific parameters
-        }}
-        }}
-        
-        For find operations, ALWAYS put filter conditions inside a "filter" object within parameters.
-        """
-        return prompt
+        return (
+            "You are a MongoDB query assistant. Convert the following natural language query "
+            "to a structured MongoDB operation.\n\n"
+            f"{db_structure}"
+        )
             
     def _parse_response(self, response: str) -> Dict:
-        try:
-            cleaned_response = response.replace("```json", "").replace("```", "").strip()
-            query_info = json.loads(cleaned_response)
-            return query_info
-        except json.JSONDecodeError:
+        start = response.find("{")
+        end = response.rfind("}")
+        
+        # Fast path: the outermost braces usually delimit exactly one object
+        if start != -1 and end > start:
             try:
-                json_pattern = r'\{.*\}'
-                match = re.search(json_pattern, response, re.DOTALL)
-                if match:
-                    query_info = json.loads(match.group(0))
-                    return query_info
-            except (json.JSONDecodeError, AttributeError):
+                return _json_loads(response[start:end + 1])
+            except ValueError:
                 pass
+        
+        # Otherwise decode the first complete JSON object in the response;
+        # code fences and surrounding prose are skipped without rewriting the string
+        while start != -1:
+            try:
+                query_info, _ = _JSON_DECODER.raw_decode(response, start)
+                return query_info
+            except json.JSONDecodeError:
+                start = response.find("{", start + 1)
             
         return {"error": "No valid JSON found in response"}
 
@@ -215,8 +377,22 @@ class QueryBuilder:
     
     def __init__(self, db_connector: MongoDBConnector):
         self.db_connector = db_connector
+        self._handlers = {
+            "find": self._handle_find,
+            "aggregate": self._handle_aggregate,
+            "insert_one": self._handle_insert_one,
+            "insert_many": self._handle_insert_many,
+            "update_one": self._handle_update_one,
+            "update_many": self._handle_update_many,
+            "delete_one": self._handle_delete_one,
+            "delete_many": self._handle_delete_many,
+            "count": self._handle_count,
+        }
         
-    def build_and_execute(self, parsed_query: Dict) -> Dict:
+    def register_operation(self, operation: str, handler):
+        self._handlers[operation] = handler
+        
+    async def build_and_execute(self, parsed_query: Dict) -> Dict:
         try:
             if "error" in parsed_query:
                 return {"error": parsed_query["error"]}
@@ -229,208 +405,288 @@ class QueryBuilder:
             if not all([database, collection, operation]):
                 return {"error": "Missing required query components"}
             
-            if operation == "find":
-                return self._handle_find(database, collection, parameters)
-            elif operation == "aggregate":
-                return self._handle_aggregate(database, collection, parameters)
-            elif operation == "insert_one":
-                return self._handle_insert_one(database, collection, parameters)
-            elif operation == "insert_many":
-                return self._handle_insert_many(database, collection, parameters)
-            elif operation == "update_one":
-                return self._handle_update_one(database, collection, parameters)
-            elif operation == "update_many":
-                return self._handle_update_many(database, collection, parameters)
-            elif operation == "delete_one":
-                return self._handle_delete_one(database, collection, parameters)
-            elif operation == "delete_many":
-                return self._handle_delete_many(database, collection, parameters)
-            elif operation == "count":
-                return self._handle_count(database, collection, parameters)
-            else:
+            handler = self._handlers.get(operation)
+            if handler is None:
                 return {"error": f"Unsupported operation: {operation}"}
             
+            return await handler(database, collection, parameters)
+            
         except Exception as e:
             return {"error": f"Error executing query: {str(e)}"}
     
-    def _serialize_result(self, result: Dict) -> Dict:
-        serialized = {}
-        for key, value in result.items():
-            if hasattr(value, '__str__') and "ObjectId" in str(type(value)):
-                serialized[key] = str(value)
-            elif isinstance(value, list) and all(hasattr(item, '__str__') and "ObjectId" in str(type(item)) for item in value):
-                serialized[key] = [str(item) for item in value]
-            else:
-                serialized[key] = value
-        return serialized
-    
-    def _handle_find(self, database: str, collection: str, parameters: Dict) -> Dict:
+    async def _handle_find(self, database: str, collection: str, parameters: Dict) -> Dict:
         filter_query = parameters.get("filter", {})
         projection = parameters.get("projection")
         sort = parameters.get("sort")
         limit = parameters.get("limit")
         skip = parameters.get("skip")
         
-        result = self.db_connector.execute_find(
+        if projection is None and not self._references_id(filter_query):
+            projection = {"_id": 0}
+        
+        cursor = await self.db_connector.execute_find(
             database, collection, filter_query, projection, sort, limit, skip
         )
         
-        return {"result": self._serialize_for_json(result), "count": len(result)}
+        return await self._stream_results(cursor)
     
-    def _handle_aggregate(self, database: str, collection: str, parameters: Dict) -> Dict:
+    async def _handle_aggregate(self, database: str, collection: str, parameters: Dict) -> Dict:
         pipeline = parameters.get("pipeline", [])
         
-        result = self.db_connector.execute_aggregate(database, collection, pipeline)
+        # Dropping _id must be the last stage so earlier stages can still use
+        # the _id index; $out/$merge have to stay last themselves
+        ends_with_write = pipeline and any(stage in pipeline[-1] for stage in ("$out", "$merge"))
+        if not ends_with_write and not self._references_id(pipeline):
+            pipeline = [*pipeline, {"$project": {"_id": 0}}]
         
-        return {"result": self._serialize_for_json(result), "count": len(result)}
+        cursor = await self.db_connector.execute_aggregate(database, collection, pipeline)
+        
+        return await self._stream_results(cursor)
     
-    def _handle_insert_one(self, database: str, collection: str, parameters: Dict) -> Dict:
+    async def _handle_insert_one(self, database: str, collection: str, parameters: Dict) -> Dict:
         document = parameters.get("document", {})
         
-        result = self.db_connector.execute_insert_one(database, collection, document)
+        result = await self.db_connector.execute_insert_one(database, collection, document)
         
-        return self._serialize_result(result)
+        return result
     
-    def _handle_insert_many(self, database: str, collection: str, parameters: Dict) -> Dict:
+    async def _handle_insert_many(self, database: str, collection: str, parameters: Dict) -> Dict:
         documents = parameters.get("documents", [])
+        # Both values come from the model, so only trust well-formed hints
+        batch_size = parameters.get("batch_size")
+        if isinstance(batch_size, bool) or not isinstance(batch_size, int) or batch_size <= 0:
+            batch_size = 100
+        fast = parameters.get("fast") is True
+        
+        result = await self.db_connector.execute_insert_many(
+            database, collection, documents, batch_size=batch_size, fast=fast
+        )
         
-        result = self.db_connector.execute_insert_many(database, collection, documents)
-        
-        return self._serialize_result(result)
+        return result
     
-    def _handle_update_one(self, database: str, collection: str, parameters: Dict) -> Dict:
+    async def _handle_update_one(self, database: str, collection: str, parameters: Dict) -> Dict:
         filter_query = parameters.get("filter", {})
         update = parameters.get("update", {})
         upsert = parameters.get("upsert", False)
         
-        result = self.db_connector.execute_update_one(
+        result = await self.db_connector.execute_update_one(
             database, collection, filter_query, update, upsert
         )
         
-        return self._serialize_result(result)
+        return result
     
-    def _handle_update_many(self, database: str, collection: str, parameters: Dict) -> Dict:
+    async def _handle_update_many(self, database: str, collection: str, parameters: Dict) -> Dict:
         filter_query = parameters.get("filter", {})
         update = parameters.get("update", {})
         upsert = parameters.get("upsert", False)
         
-        result = self.db_connector.execute_update_many(
+        result = await self.db_connector.execute_update_many(
             database, collection, filter_query, update, upsert
         )
         
-        return self._serialize_result(result)
+        return result
     
-    def _handle_delete_one(self, database: str, collection: str, parameters: Dict) -> Dict:
+    async def _handle_delete_one(self, database: str, collection: str, parameters: Dict) -> Dict:
         filter_query = parameters.get("filter", {})
         
-        result = self.db_connector.execute_delete_one(database, collection, filter_query)
+        result = await self.db_connector.execute_delete_one(database, collection, filter_query)
         
-        return self._serialize_result(result)
+        return result
     
-    def _handle_delete_many(self, database: str, collection: str, parameters: Dict) -> Dict:
+    async def _handle_delete_many(self, database: str, collection: str, parameters: Dict) -> Dict:
         filter_query = parameters.get("filter", {})
         
-        result = self.db_connector.execute_delete_many(database, collection, filter_query)
+        result = await self.db_connector.execute_delete_many(database, collection, filter_query)
         
-        return self._serialize_result(result)
+        return result
     
-    def _handle_count(self, database: str, collection: str, parameters: Dict) -> Dict:
+    async def _handle_count(self, database: str, collection: str, parameters: Dict) -> Dict:
         filter_query = parameters.get("filter", {})
         
-        count = self.db_connector.count_documents(database, collection, filter_query)
+        count = await self.db_connector.count_documents(database, collection, filter_query)
         
         return {"count": count}
     
-    def _serialize_for_json(self, data: Any) -> Any:
-        if isinstance(data, list):
-            return [self._serialize_for_json(item) for item in data]
-        elif isinstance(data, dict):
-            result = {}
-            for key, value in data.items():
-                if key == '_id' and hasattr(value, '__str__'):
-                    result[key] = str(value)
-                else:
-                    result[key] = self._serialize_for_json(value)
-            return result
-        else:
-            return data
+    async def _stream_results(self, cursor: AsyncIterator[Dict]) -> Dict:
+        # Fetch the first document here so lazy cursors raise execution errors
+        # inside build_and_execute; the rest is streamed and counted as printed
+        try:
+            first = await cursor.__anext__()
+        except StopAsyncIteration:
+            return {"result": []}
+        
+        return {"result": self._chain_first(first, cursor)}
+    
+    async def _chain_first(self, first: Dict, cursor: AsyncIterator[Dict]) -> AsyncIterator[Dict]:
+        yield first
+        async for document in cursor:
+            yield document
+    
+    # Stages that emit their grouping key as _id without naming it
+    ID_PRODUCING_STAGES = ("$sortByCount", "$bucket", "$bucketAuto")
+    
+    def _references_id(self, value) -> bool:
+        if isinstance(value, dict):
+            return any(key == "_id" or key in self.ID_PRODUCING_STAGES or self._references_id(item)
+                       for key, item in value.items())
+        if isinstance(value, list):
+            return any(self._references_id(item) for item in value)
+        return isinstance(value, str) and value.startswith("$_id")
 
 
 class SchemaExplorer:
     
-    def __init__(self, db_connector: MongoDBConnector):
+    def __init__(self, db_connector: MongoDBConnector, cache_ttl: int = CACHE_TTL_SECONDS):
         self.db_connector = db_connector
+        self.cache_ttl = cache_ttl
         
-    def get_all_schema_info(self) -> Dict:
+    async def get_all_schema_info(self, refresh: bool = False) -> Dict:
+        cache_path = await self._get_cache_path()
+        
+        schema_info = None if refresh else self._load_cache(cache_path)
+        if schema_info is None:
+            schema_info = await self._discover_schema_info()
+            self._write_cache(cache_path, schema_info)
+        
+        return schema_info
+    
+    async def _get_cache_path(self) -> str:
+        server_version = await self.db_connector.get_server_version()
+        cache_key = f"{self.db_connector.connection_string}|{server_version}"
+        digest = hashlib.sha256(cache_key.encode()).hexdigest()[:16]
+        return os.path.join(CACHE_DIR, f"schema_{digest}.json")
+    
+    def _load_cache(self, cache_path: str):
+        try:
+            if time.time() - os.path.getmtime(cache_path) > self.cache_ttl:
+                return None
+            with open(cache_path, "r", encoding="utf-8") as f:
+                return _json_loads(f.read())
+        except (OSError, ValueError):
+            return None
+    
+    def _write_cache(self, cache_path: str, schema_info: Dict):
+        tmp_path = None
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", dir=CACHE_DIR, suffix=".tmp",
+                                             delete=False, encoding="utf-8") as f:
+                tmp_path = f.name
+                f.write(_json_dumps(schema_info))
+            os.replace(tmp_path, cache_path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Could not cache schema info: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    async def _discover_schema_info(self) -> Dict:
         schema_info = {"databases": {}}
         
-        databases = self.db_connector.get_databases()
+        databases = await self.db_connector.get_databases()
+        collections_per_db = await asyncio.gather(
+            *(self.db_connector.get_collections(db_name) for db_name in databases)
+        )
         
-        for db_name in databases:
+        targets = []
+        for db_name, collections in zip(databases, collections_per_db):
             schema_info["databases"][db_name] = {"collections": {}}
-            
-            collections = self.db_connector.get_collections(db_name)
-            
-            for coll_name in collections:
-                coll_schema = self.db_connector.get_collection_schema(db_name, coll_name)
-                sample_data = self.db_connector.get_sample_data(db_name, coll_name, limit=1)
-                
-                schema_info["databases"][db_name]["collections"][coll_name] = {
-                    "schema": coll_schema,
-                    "sample": self._serialize_for_json(sample_data[0]) if sample_data else None
-                }
+            targets.extend((db_name, coll_name) for coll_name in collections)
+        
+        # Every collection probe is independent, so issue them all concurrently;
+        # the connector's configured max_pool_size bounds the in-flight requests
+        probes = await asyncio.gather(
+            *(self._probe_collection(db_name, coll_name) for db_name, coll_name in targets)
+        )
+        
+        for (db_name, coll_name), coll_info in zip(targets, probes):
+            schema_info["databases"][db_name]["collections"][coll_name] = coll_info
         
         return schema_info
     
-    def _serialize_for_json(self, data: Any) -> Any:
-        if isinstance(data, list):
-            return [self._serialize_for_json(item) for item in data]
-        elif isinstance(data, dict):
-            result = {}
-            for key, value in data.items():
-                if key == '_id' and hasattr(value, '__str__'):
-                    result[key] = str(value)
-                else:
-                    result[key] = self._serialize_for_json(value)
-            return result
-        else:
-            return data
+    async def _probe_collection(self, db_name: str, coll_name: str) -> Dict:
+        # One round-trip per collection: schema inference and the sample
+        # document are computed from the same $sample in a single $facet
+        cursor = await self.db_connector.execute_aggregate(db_name, coll_name, [
+            {"$sample": {"size": SCHEMA_SAMPLE_SIZE}},
+            {"$facet": {
+                "schema": SCHEMA_TYPE_STAGES,
+                "sample": [{"$limit": 1}, {"$project": {"_id": 0}}]
+            }}
+        ])
+        profile = await cursor.to_list(1)
+        fields = profile[0]["schema"] if profile else []
+        sample_data = profile[0]["sample"] if profile else []
+        
+        return {
+            "schema": {field["_id"]: field["type"] for field in fields},
+            "sample": sample_data[0] if sample_data else None
+        }
 
 
 class QueryClassifier:
-    def classify_query(self, query: str) -> str:
-        query = query.lower()
-        
-        schema_keywords = [
+    
+    # Ordered by priority: an earlier category wins when keywords from several match
+    KEYWORD_CATEGORIES = [
+        ("schema_exploration", [
             "what collections", "what tables", "show collections", "show tables",
             "what fields", "what columns", "schema", "structure", "sample data"
-        ]
-        
-        for keyword in schema_keywords:
-            if keyword in query:
-                return "schema_exploration"
-        
-        if any(kw in query for kw in ["add", "insert", "create", "put"]):
-            return "data_modification_insert"
-        
-        if any(kw in query for kw in ["update", "change", "modify", "set"]):
-            return "data_modification_update"
-        
-        if any(kw in query for kw in ["delete", "remove", "drop"]):
-            return "data_modification_delete"
-        
-        return "query"
+        ]),
+        ("data_modification_insert", ["add", "insert", "create", "put"]),
+        ("data_modification_update", ["update", "change", "modify", "set"]),
+        ("data_modification_delete", ["delete", "remove", "drop"]),
+    ]
+    
+    def __init__(self):
+        self.automaton = ahocorasick.Automaton()
+        for priority, (category, keywords) in enumerate(self.KEYWORD_CATEGORIES):
+            for keyword in keywords:
+                self.automaton.add_word(keyword, (priority, category))
+        self.automaton.make_automaton()
+    
+    def classify_query(self, query: str) -> str:
+        # Matches arrive in text order, so keep the highest-priority category seen
+        best = None
+        for _, (priority, category) in self.automaton.iter(query.lower()):
+            if priority == 0:
+                return category
+            if best is None or priority < best[0]:
+                best = (priority, category)
+        
+        return best[1] if best else "query"
+
+def _mongo_default(obj):
+    if isinstance(obj, (ObjectId, Decimal128)):
+        return str(obj)
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if isinstance(obj, bytes):
+        return base64.b64encode(obj).decode("ascii")
+    # Remaining BSON types (Timestamp, Regex, Code, ...) as extended JSON
+    return json_util.default(obj)
+
+
+def _json_dumps(obj, indent: bool = False, sort_keys: bool = False) -> str:
+    if orjson is not None:
+        option = (orjson.OPT_INDENT_2 if indent else 0) | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(obj, default=_mongo_default, option=option).decode()
+    return json.dumps(obj, indent=2 if indent else None, sort_keys=sort_keys, cls=MongoJSONEncoder)
+
+
+def _json_loads(data: str):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
 
 class MongoJSONEncoder(json.JSONEncoder):
     def default(self, obj):
-        if isinstance(obj, ObjectId):
-            return str(obj)
-        return super().default(obj)
+        return _mongo_default(obj)
     
 class MongoDBChatbot:
     
-    def __init__(self, connection_string: str = 'mongodb://localhost:27017/', openai_api_key: str = None):
-        self.db_connector = MongoDBConnector(connection_string)
+    def __init__(self, connection_string: str = 'mongodb://localhost:27017/', openai_api_key: str = None,
+                 **connector_options):
+        self.db_connector = MongoDBConnector(connection_string, **connector_options)
         
         self.schema_explorer = SchemaExplorer(self.db_connector)
         self.query_classifier = QueryClassifier()
@@ -449,59 +705,97 @@ class MongoDBChatbot:
             self.nlp_processor = None
             self.query_builder = None
             
-        self.schema_info = self.schema_explorer.get_all_schema_info()
-        
-    def process_user_query(self, query: str) -> Dict:
+        self.schema_info = None
+        self.session = None
+        self._name_index = {}
+    
+    async def initialize(self):
+        await self.db_connector.connect()
+        self.schema_info = await self.schema_explorer.get_all_schema_info()
+        self._build_name_index()
+    
+    async def refresh_schema(self):
+        self.db_connector.clear_collection_cache()
+        self.schema_info = await self.schema_explorer.get_all_schema_info(refresh=True)
+        self._build_name_index()
+        if self.session:
+            self.session.completer = self._build_completer()
+    
+    def _build_name_index(self):
+        # lowercase name -> [(kind, canonical name, parent db)]; a list because
+        # the same collection name can exist in several databases
+        self._name_index = {}
+        for db_name, db_info in self.schema_info["databases"].items():
+            self._name_index.setdefault(db_name.lower(), []).append(("db", db_name, None))
+            for coll_name in db_info["collections"]:
+                self._name_index.setdefault(coll_name.lower(), []).append(("coll", coll_name, db_name))
+    
+    def _build_completer(self) -> WordCompleter:
+        names = set()
+        for db_name, db_info in self.schema_info["databases"].items():
+            names.add(db_name)
+            names.update(db_info["collections"])
+        return WordCompleter(sorted(names), ignore_case=True)
+        
+    async def process_user_query(self, query: str) -> Dict:
         query_type = self.query_classifier.classify_query(query)
         
         if query_type == "schema_exploration":
-            return self._handle_schema_exploration(query)
+            return await self._handle_schema_exploration(query)
         
         if not self.nlp_processor:
             return {"status": "error", "message": "NLP processor not available"}
         
         try:
             print("\nSending query to NLP model...")
-            parsed_query = self.nlp_processor.process_query(query, self.schema_info)
+            parsed_query = await self.nlp_processor.process_query(query, self.schema_info)
             
             if "error" in parsed_query:
                 print(f"\nNLP processing error: {parsed_query['error']}")
                 return {"status": "error", "message": parsed_query["error"]}
             
             print("\nExecuting MongoDB query...")
-            result = self.query_builder.build_and_execute(parsed_query)
+            result = await self.query_builder.build_and_execute(parsed_query)
             
             if "error" in result:
                 return {"status": "error", "message": result["error"]}
             else:
+                self.nlp_processor.remember(query, self.schema_info, parsed_query)
                 return {"status": "success", "data": result, "query": parsed_query}
         except Exception as e:
             print(f"\nException during query processing: {str(e)}")
             return {"status": "error", "message": f"Error processing query: {str(e)}"}
     
-    def _handle_schema_exploration(self, query: str) -> Dict:
+    async def process_user_queries(self, queries: List[str]) -> List[Dict]:
+        return await asyncio.gather(*(self.process_user_query(query) for query in queries))
+    
+    async def _handle_schema_exploration(self, query: str) -> Dict:
         query_lower = query.lower()
+        words = [word.strip(".,;:?!'\"()") for word in query_lower.split()]
+        candidates = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+        matches = [entry for candidate in candidates for entry in self._name_index.get(candidate, ())]
         
-        db_name = None
+        db_name = next((name for kind, name, _ in matches if kind == "db"), None)
         coll_name = None
         
-        for db in self.schema_info["databases"]:
-            if db.lower() in query_lower:
-                db_name = db
-                break
+        # Substring scans only cover names the tokenizer cannot isolate
+        if db_name is None:
+            db_name = next((db for db in self.schema_info["databases"] if db.lower() in query_lower), None)
         
         if db_name:
-            for coll in self.schema_info["databases"][db_name]["collections"]:
-                if coll.lower() in query_lower:
-                    coll_name = coll
-                    break
+            coll_name = next(
+                (name for kind, name, parent in matches if kind == "coll" and parent == db_name), None
+            )
+            if coll_name is None:
+                coll_name = next((coll for coll in self.schema_info["databases"][db_name]["collections"]
+                                  if coll.lower() in query_lower), None)
         
         if db_name and coll_name:
             collection_info = self.schema_info["databases"][db_name]["collections"][coll_name]
             
             if "sample" in query_lower or "example" in query_lower:
-                samples = self.db_connector.get_sample_data(db_name, coll_name, limit=5)
-                collection_info["samples"] = [self.query_builder._serialize_for_json(s) for s in samples]
+                samples = await self.db_connector.get_sample_data(db_name, coll_name, limit=5)
+                collection_info["samples"] = samples
             
             return {
                 "status": "success",
@@ -531,17 +825,21 @@ class MongoDBChatbot:
                 }
             }
         
-    def _ensure_serializable(self, obj):
-        if isinstance(obj, dict):
-            return {k: self._ensure_serializable(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [self._ensure_serializable(item) for item in obj]
-        elif hasattr(obj, '__str__') and "ObjectId" in str(type(obj)):
-            return str(obj)
-        else:
-            return obj
+    async def _print_data(self, data: Dict):
+        stream = data.get("result")
+        if not hasattr(stream, "__aiter__"):
+            print(_json_dumps(data, indent=True))
+            return
+        
+        streamed = 0
+        async for document in stream:
+            sys.stdout.write(_json_dumps(document, indent=True))
+            sys.stdout.write("\n")
+            streamed += 1
+        
+        print(f"\nCount: {streamed}")
     
-    def run_interactive(self):
+    async def run_interactive(self):
         print("\nMongoDB Natural Language Interface")
         print("=================================")
         print("Available databases:")
@@ -550,28 +848,36 @@ class MongoDBChatbot:
             collections = list(self.schema_info["databases"][db_name]["collections"].keys())
             print(f"- {db_name}: {', '.join(collections)}")
         
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        self.session = PromptSession(history=FileHistory(HISTORY_PATH), completer=self._build_completer())
+        
         while True:
             try:
-                query = input("\nEnter your query: ")
+                query = await self.session.prompt_async("\nEnter your query: ")
                 
                 if query.lower() in ['exit', 'quit']:
                     print("\nGoodbye!")
                     break
                 
+                if query.lower() == 'refresh':
+                    await self.refresh_schema()
+                    print("\nSchema information refreshed.")
+                    continue
+                
                 print("\nProcessing query...")
-                result = self.process_user_query(query)
+                result = await self.process_user_query(query)
                 
                 if result["status"] == "error":
                     print(f"\nError: {result['message']}")
                 else:
                     print("\nResult:")
-                    print(json.dumps(result["data"], indent=2, cls=MongoJSONEncoder))
+                    await self._print_data(result["data"])
                     
                     if "query" in result:
                         print("\nInterpreted as:")
-                        print(json.dumps(result["query"], indent=2, cls=MongoJSONEncoder))
+                        print(_json_dumps(result["query"], indent=True))
             
-            except KeyboardInterrupt:
+            except (KeyboardInterrupt, EOFError):
                 print("\n\nExiting...")
                 break
             except Exception as e:
@@ -580,7 +886,6 @@ class MongoDBChatbot:
 
 if __name__ == "__main__":
     try:
-        import os
         openai_api_key = os.environ.get("OPENAI_API_KEY")
         
         if not openai_api_key:
@@ -591,7 +896,14 @@ if __name__ == "__main__":
         connection_string = 'mongodb://localhost:27017/'
         chatbot = MongoDBChatbot(connection_string, openai_api_key)
         
-        chatbot.run_interactive()
+        async def main():
+            try:
+                await chatbot.initialize()
+                await chatbot.run_interactive()
+            finally:
+                await chatbot.db_connector.close()
+        
+        asyncio.run(main())
     except Exception as e:
         print(f"Error initializing the application: {str(e)}")
         sys.exit(1)
\ No newline at end of file